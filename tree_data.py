@@ -1,10 +1,16 @@
 """
 Using GUI to visualize the byte size of files in a repository through recursive methods.
 """
+from concurrent.futures import ThreadPoolExecutor
 import os
-from random import randint
+from random import getrandbits
 import math
 
+# Folders are scanned in parallel once a level of the walk has more than
+# this many of them; scanning is I/O bound, so threads can overlap it.
+PARALLEL_SCAN_THRESHOLD = 8
+_SCAN_EXECUTOR = ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2)
+
 
 class AbstractTree:
     """A tree that is compatible with the treemap visualiser.
@@ -26,6 +32,13 @@ class AbstractTree:
     @type _parent_tree: AbstractTree | None
         The parent tree of this tree; i.e., the tree that contains this tree
         as a subtree, or None if this tree is not part of a larger tree.
+    @type _treemap_cache: ((int, int, int, int), tuple) | None
+        The rect this tree was last divided in by generate_leaf_rects and
+        the rects it gave each of its subtrees, or None if this tree has
+        changed since.
+    @type _separator_cache: str | None
+        The string returned by get_separator, or None if it has not been
+        computed yet.
 
     === Representation Invariants ===
     - data_size >= 0
@@ -82,7 +95,11 @@ class AbstractTree:
         self._root = root
         self._subtrees = subtrees
         self._parent_tree = None
-        self.colour = (randint(0, 255), randint(0, 255), randint(0, 255))
+        self._treemap_cache = None
+        self._separator_cache = None
+        # one random 24-bit number is much cheaper than three randint calls.
+        bits = getrandbits(24)
+        self.colour = (bits & 0xFF, (bits >> 8) & 0xFF, (bits >> 16) & 0xFF)
         # data size of the tree.
         self.data_size = data_size
         if len(self._subtrees) > 0:
@@ -128,111 +145,81 @@ class AbstractTree:
         >>> len(tree_map) > 0
         True
         """
-        treemap_lst = []
-        remainder = 0
-        subtrees = self._subtrees
-        index = 0
-        if self.data_size == 0:  # self is a leaf and has 0 data
-            return treemap_lst
-        elif len(self._subtrees) == 0:  # self is a leaf and has some data
-            treemap_lst += [(rect, self.colour)]
-        else:  # self is not a leaf
-            # divide the rectangles vertically
-            if rect[2] > rect[3]:
-                x_position = rect[0]
-                while index != len(subtrees) - 1:
-                    width = rect[2] * (subtrees[index].data_size
-                                       / self.data_size)
-                    width = math.floor(width)
-                    v_rect = (x_position, rect[1], width, rect[3])
-                    treemap_lst += subtrees[index].generate_treemap(v_rect)
-                    remainder += width
-                    x_position += width
-                    index += 1
-                width = rect[2] - remainder
-                v_rect = (x_position, rect[1], width, rect[3])
-                treemap_lst += subtrees[index].generate_treemap(v_rect)
-            # divide the rectangles horizontally
-            elif rect[3] > rect[2]:
-                y_position = rect[1]
-                while index != len(subtrees) - 1:
-                    height = rect[3] * (subtrees[index].data_size
-                                        / self.data_size)
-                    height = math.floor(height)
-                    h_rect = (rect[0], y_position, rect[2], height)
-                    treemap_lst += subtrees[index].generate_treemap(h_rect)
-                    remainder += height
-                    y_position += height
-                    index += 1
-                height = rect[3] - remainder
-                h_rect = (rect[0], y_position, rect[2], height)
-                treemap_lst += subtrees[index].generate_treemap(h_rect)
-        return treemap_lst
-
-    def locate_leaf(self, pos, rect):
-        """Returns the path of the node from itself to its parent tree
-        and the node's data_size as a list of strings.
-
-        Searches through the tree recursively, creating new rectangles for
-        each file similarily to generate_treemap and finds the recatangle
-        which contains pos inside its space.
-
-        Precondition: pos is a tuple of two positive integers.
+        return [(leaf_rect, leaf.colour)
+                for leaf_rect, leaf in self._iter_leaf_rects(rect)]
+
+    def generate_leaf_rects(self, rect):
+        """Run the treemap algorithm on this tree and return the rectangle of
+        each non-empty leaf, paired with the leaf itself:
+        ((x, y, width, height), leaf).
+
+        The rectangles are the ones generate_treemap returns, in the same
+        order. The division of every subtree's rect between its own subtrees
+        is cached, so a subtree that has not changed and is given the same
+        rect is not divided again.
+
+        Used by treemap_visualiser to find the leaf under the mouse.
+
+        Precondition: rect width != height
 
         @type self: AbstractTree
-        @type pos: (int, int, int, int)
         @type rect: (int, int, int, int)
-        @rtype: list[str]
+            Input is in the pygame format: (x, y, width, height)
+        @rtype: list[((int, int, int, int), AbstractTree)]
+
+        >>> leaf = AbstractTree('leaf', [], 1)
+        >>> tree = AbstractTree('tree', [leaf, AbstractTree('other', [], 3)])
+        >>> leaf_rects = tree.generate_leaf_rects((0, 0, 100, 50))
+        >>> leaf_rects[0] == ((0, 0, 25, 50), leaf)
+        True
         """
-        remainder = 0
-        leaf_data = []
-        if self.data_size == 0:
-            return ['', '']
-        elif len(self._subtrees) == 0:
-            leaf_data = [self.get_separator(), str(self.data_size)]
-        else:
-            if rect[2] > rect[3]:
-                x_position = rect[0]
-                for subtree in self._subtrees:
-                    if subtree == self._subtrees[-1]:
-                        width = rect[2] - remainder
-                        v_rect = (x_position, rect[1], int(width), rect[3])
-                    else:
-                        width = rect[2]*(subtree.data_size/self.data_size)
-                        width = math.floor(width)
-                        v_rect = (x_position, rect[1], int(width), rect[3])
-                        remainder += width
-                        x_position += width
-                    x_range = v_rect[0] + v_rect[2]
-                    y_range = v_rect[1] + v_rect[3]
-                    if pos[0] in range(x_range) and pos[1] in range(y_range):
-                        leaf_data = subtree.locate_leaf(pos, v_rect)
-                        break
+        return list(self._iter_leaf_rects(rect))
+
+    def _iter_leaf_rects(self, rect):
+        """Yield the (rect, leaf) pairs of generate_leaf_rects, in order.
+
+        generate_treemap consumes the pairs one at a time, instead of making
+        a list of all of them first.
+
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+        @rtype: iterator[((int, int, int, int), AbstractTree)]
+        """
+        # (tree, rect) pairs still to be laid out, instead of recursing.
+        stack = [(self, rect)]
+        while len(stack) > 0:
+            tree, rect = stack.pop()
+            subtrees = tree._subtrees
+            if tree.data_size == 0:  # tree is a leaf and has 0 data
+                continue
+            elif len(subtrees) == 0:  # tree is a leaf and has some data
+                yield rect, tree
+                continue
+            cache = tree._treemap_cache
+            if cache is not None and cache[0] == rect:
+                sub_rects = cache[1]
             else:
-                y_position = rect[1]
-                for subtree in self._subtrees:
-                    if subtree == self._subtrees[-1]:
-                        height = rect[3] - remainder
-                        h_rect = (rect[0], y_position, rect[2], int(height))
-                    else:
-                        height = rect[3]*(subtree.data_size/self.data_size)
-                        height = math.floor(height)
-                        h_rect = (rect[0], y_position, rect[2], int(height))
-                        remainder += height
-                        y_position += height
-                    x_range = h_rect[0] + h_rect[2]
-                    y_range = h_rect[1] + h_rect[3]
-                    if pos[0] in range(x_range) and pos[1] in range(y_range):
-                        leaf_data = subtree.locate_leaf(pos, h_rect)
-                        break
-        return leaf_data
+                width, height = rect[2], rect[3]
+                if width == height:  # a square rect is not divided
+                    continue
+                sizes = [subtree.data_size for subtree in subtrees]
+                # divide the rectangles vertically if rect is wider than it
+                # is tall, horizontally otherwise.
+                sub_rects = _split_rect(sizes, tree.data_size, rect,
+                                        width > height)
+                # a tuple of int tuples, which the garbage collector stops
+                # tracking, so a large cache does not slow down collections.
+                tree._treemap_cache = (rect, tuple(sub_rects))
+            # pushed in reverse so the subtrees are laid out in order.
+            for index in range(len(sub_rects) - 1, -1, -1):
+                stack.append((subtrees[index], sub_rects[index]))
 
     def increase_data_size(self, leaf):
         """Takes the given leaf of the tree and increases its data size by
         1%. Adjusts all of the subtrees and the entire tree's data size
         accordingly.
 
-        Precondition: leaf must be a valid leaf node of this class.
+        Precondition: leaf must be a non-empty leaf of this tree.
 
         There is no upper limit on the leaf's data_size.
 
@@ -242,21 +229,21 @@ class AbstractTree:
         @type self: AbstractTree
         @type leaf: AbstractTree
         @rtype: None
+
+        >>> leaf = AbstractTree('leaf', [], 200)
+        >>> tree = AbstractTree('tree', [leaf, AbstractTree('other', [], 5)])
+        >>> tree.increase_data_size(leaf)
+        >>> leaf.data_size, tree.data_size
+        (202, 207)
         """
-        leaf_name = os.path.basename(leaf)
-        if self._root == leaf:
-            self.data_size += math.ceil((self.data_size*0.01))
-        else:
-            for subtree in self._subtrees:
-                subtree.increase_data_size(leaf_name)
-                subtree.data_size = subtree.update_data_size()
+        leaf._add_data_size(math.ceil(leaf.data_size * 0.01))
 
     def decrease_data_size(self, leaf):
         """Takes the given leaf of the tree and decreases its data size
         by 1%. Adjusts all of the subtrees and the entire tree's data
         size accordingly.
 
-        Precondition: leaf must be a valid leaf node of this class.
+        Precondition: leaf must be a non-empty leaf of this tree.
 
         The leaf's data_size cannot drop below 1.
 
@@ -266,16 +253,32 @@ class AbstractTree:
         @type self: AbstractTree
         @type leaf: AbstractTree
         @rtype: None
+
+        >>> leaf = AbstractTree('leaf', [], 1)
+        >>> tree = AbstractTree('tree', [leaf, AbstractTree('other', [], 5)])
+        >>> tree.decrease_data_size(leaf)
+        >>> leaf.data_size, tree.data_size
+        (1, 6)
+        """
+        data_size = leaf.data_size - math.ceil(leaf.data_size * 0.01)
+        if data_size < 1:
+            data_size = 1
+        leaf._add_data_size(data_size - leaf.data_size)
+
+    def _add_data_size(self, delta):
+        """Add <delta> to the data_size of this tree and of every tree that
+        contains it, keeping each of their data_sizes the sum of their
+        subtrees'.
+
+        @type self: AbstractTree
+        @type delta: int
+        @rtype: None
         """
-        leaf_name = os.path.basename(leaf)
-        if self._root == leaf_name:
-            self.data_size -= math.ceil((self.data_size * 0.01))
-            if self.data_size < 1:
-                self.data_size = 1
-        else:
-            for subtree in self._subtrees:
-                subtree.decrease_data_size(leaf_name)
-                subtree.data_size = subtree.update_data_size()
+        tree = self
+        while tree is not None:
+            tree.data_size += delta
+            tree = tree._parent_tree
+        self._invalidate_treemap()
 
     def update_data_size(self):
         """Finds the total data_size of self by recursing through each of
@@ -283,8 +286,9 @@ class AbstractTree:
 
         If the subtree has a data_size of 0, it will be ignored.
 
-        Used in treemap_visualizer whenever the data_size of the tree is
-        altered.
+        increase_data_size, decrease_data_size and delete_leaf keep every
+        data_size up to date themselves, so this is only needed after
+        data_sizes are changed some other way.
 
         @type self: FileSystemTree
         @rtype: int
@@ -298,37 +302,41 @@ class AbstractTree:
         return updated_data_size
 
     def delete_leaf(self, leaf):
-        """Locates the given leaf inside the tree and sets it as an empty tree.
+        """Sets the given leaf of the tree as an empty tree.
         Meaning that its root is set to None, it will have no subtrees and its
         data_size will be set to 0.
 
-        Updates entire tree's data_size accordingly.
+        Updates entire tree's data_size accordingly, by subtracting the
+        leaf's old data_size from each tree that contains it.
 
         The leaf will still be inside the subtree of its parent tree. It
         will simply be ignored when generate_treemap is run on the tree.
 
+        Precondition: leaf must be a non-empty leaf of this tree.
+
         Used by treemap_visualiser to rerender the AbstractTree without
         the selected leaf.
 
         @type self: AbstractTree
-        @type leaf: str
+        @type leaf: AbstractTree
         @rtype: None
         """
-        leaf_name = os.path.basename(leaf)
-        found = False
-        if self._root == leaf_name:
-            self._root = None
-            self._subtrees = []
-            return True
-        elif len(self._subtrees) == 0:
-            return False
-        else:
-            for subtree in self._subtrees:
-                if found is False:
-                    if subtree.delete_leaf(leaf_name):
-                        subtree.data_size = 0
-                        found = True
-                subtree.data_size = subtree.update_data_size()
+        leaf._add_data_size(-leaf.data_size)
+        leaf._root = None
+        leaf._subtrees = []
+        leaf._separator_cache = None
+
+    def _invalidate_treemap(self):
+        """Discard the cached treemap rectangles of this tree and of every
+        tree that contains it, after this tree's data has changed.
+
+        @type self: AbstractTree
+        @rtype: None
+        """
+        tree = self
+        while tree is not None:
+            tree._treemap_cache = None
+            tree = tree._parent_tree
 
     def get_separator(self):
         """Return the string used to separate nodes in the string
@@ -356,15 +364,22 @@ class FileSystemTree(AbstractTree):
     path. E.g., store 'assignments', not '/Users/David/csc148/assignments'
 
     The data_size attribute for regular files as simply the size of the file,
-    as reported by os.path.getsize.
+    as reported by os.stat (st_size; DirEntry.stat for files found while
+    walking a folder). Symbolic links are followed, so a link to a file
+    has the size of the file it points to.
     """
-    def __init__(self, path):
+    def __init__(self, path, data_size=None):
         """Store the file tree structure contained in the given file or folder.
 
+        If <data_size> is given, <path> is not looked at again: the tree is
+        created with no subtrees and that data_size. This is used by
+        _load_folder, which already knows the size of each file.
+
         Precondition: <path> is a valid path for this computer.
 
         @type self: FileSystemTree
         @type path: str
+        @type data_size: int | None
         @rtype: None
 
         >>> path = "C:/Users/James Park/Desktop/test1"
@@ -383,18 +398,51 @@ class FileSystemTree(AbstractTree):
         """
         self._name = path
 
-        if os.path.isfile(self._name):
-            AbstractTree.__init__(self, os.path.basename(self._name), [])
-            self.data_size = os.path.getsize(self._name)
+        if data_size is not None:
+            AbstractTree.__init__(self, os.path.basename(self._name), [],
+                                  data_size)
+        elif os.path.isfile(self._name):
+            AbstractTree.__init__(self, os.path.basename(self._name), [],
+                                  os.path.getsize(self._name))
         elif os.path.isdir(self._name):
             AbstractTree.__init__(self, os.path.basename(self._name), [])
-            for file_name in os.listdir(self._name):
-                directory_item = os.path.join(self._name, file_name)
-                temp_fst = FileSystemTree(directory_item)
-                self._subtrees += [temp_fst]
-            for file in self._subtrees:
-                self.data_size += file.data_size
-                file._parent_tree = self
+            self._load_folder()
+
+    def _load_folder(self):
+        """Add a subtree for every file and folder inside this folder, one
+        level at a time, then set the data_size of every folder found.
+
+        The folders of a level are scanned on _SCAN_EXECUTOR when there are
+        more than PARALLEL_SCAN_THRESHOLD of them.
+
+        @type self: FileSystemTree
+        @rtype: None
+        """
+        folders = [self]  # every folder, in the order it was scanned.
+        level = [self]
+        while len(level) > 0:
+            paths = [folder._name for folder in level]
+            if len(paths) > PARALLEL_SCAN_THRESHOLD:
+                scans = _SCAN_EXECUTOR.map(_scan_folder, paths)
+            else:
+                scans = map(_scan_folder, paths)
+            next_level = []
+            for folder, items in zip(level, scans):
+                for path, data_size in items:
+                    if data_size is None:  # path is a folder
+                        subtree = FileSystemTree(path, 0)
+                        next_level.append(subtree)
+                    else:
+                        subtree = FileSystemTree(path, data_size)
+                    subtree._parent_tree = folder
+                    folder._subtrees.append(subtree)
+            folders.extend(next_level)
+            level = next_level
+        # deeper folders come later in folders, so they are summed first.
+        for folder in reversed(folders):
+            folder.data_size = 0
+            for subtree in folder._subtrees:
+                folder.data_size += subtree.data_size
 
     def get_separator(self):
         """Return the string used to separate nodes in the string
@@ -403,6 +451,8 @@ class FileSystemTree(AbstractTree):
         Used by the treemap visualiser to generate a string displaying
         the items from the root of the tree to the currently selected leaf.
 
+        The string is computed once, then cached.
+
         @type self: FileSystemTree
         @rtype: str
 
@@ -411,10 +461,76 @@ class FileSystemTree(AbstractTree):
         >>> fst.get_separator()
         'test1'
         """
-        route = ''
-        if self._parent_tree is None:
-            return str(self._root)
-        else:
-            route += self._parent_tree.get_separator()
-            route += ("\\" + str(self._root))
-        return route
+        if self._separator_cache is None:
+            if self._parent_tree is None:
+                self._separator_cache = str(self._root)
+            else:
+                self._separator_cache = (self._parent_tree.get_separator()
+                                         + "\\" + str(self._root))
+        return self._separator_cache
+
+
+def _scan_folder(path):
+    """Return a (path, data_size) tuple for every file and folder directly
+    inside the folder at <path>, using a single os.scandir pass.
+
+    data_size is the size of the file, or None if the item is a folder.
+    Items that are neither files nor folders are left out.
+
+    @type path: str
+    @rtype: list[(str, int | None)]
+    """
+    items = []
+    # the iterator is not a context manager before Python 3.6; it closes
+    # itself once it has been read to the end.
+    for entry in os.scandir(path):
+        if entry.is_file():
+            items.append((entry.path, entry.stat().st_size))
+        elif entry.is_dir():
+            items.append((entry.path, None))
+    return items
+
+
+def _split_rect(sizes, total, rect, vertical):
+    """Return the rectangles that divide <rect> between <sizes>, in order.
+
+    If <vertical> is True, the rectangles are side by side; otherwise they
+    are stacked. Each rectangle but the last gets floor(side * size / total)
+    of the divided side, and the last gets whatever remains.
+
+    @type sizes: list[int]
+    @type total: int
+    @type rect: (int, int, int, int)
+    @type vertical: bool
+    @rtype: list[(int, int, int, int)]
+
+    >>> _split_rect([1, 1, 2], 4, (0, 0, 100, 50), True)
+    [(0, 0, 25, 50), (25, 0, 25, 50), (50, 0, 50, 50)]
+    >>> _split_rect([1, 2], 3, (10, 0, 40, 90), False)
+    [(10, 0, 40, 30), (10, 30, 40, 60)]
+    >>> _split_rect([49, 0], 49, (0, 0, 49, 20), True)
+    [(0, 0, 49, 20), (49, 0, 0, 20)]
+    """
+    x, y, width, height = rect
+    sub_rects = []
+    remainder = 0
+    # exact integer floor: no float division, and a subtree holding all of
+    # the data gets the whole side even when it is not the last one.
+    if vertical:
+        x_position = x
+        for size in sizes[:-1]:
+            sub_width = (width * size) // total
+            sub_rects.append((x_position, y, sub_width, height))
+            remainder += sub_width
+            x_position += sub_width
+        sub_rects.append((x_position, y, width - remainder, height))
+    else:
+        y_position = y
+        for size in sizes[:-1]:
+            sub_height = (height * size) // total
+            sub_rects.append((x, y_position, width, sub_height))
+            remainder += sub_height
+            y_position += sub_height
+        sub_rects.append((x, y_position, width, height - remainder))
+    return sub_rects
+
@@ -6,7 +6,6 @@ concrete subclass, of course), rendering it to the user using pygame,
 and detecting user events like mouse clicks and key presses and responding
 to them.
 """
-import math
 import pygame
 import sys
 
@@ -23,6 +22,20 @@ TREEMAP_HEIGHT = HEIGHT - FONT_HEIGHT  # The height of the treemap display.
 # Font to use for the treemap program.
 FONT_FAMILY = 'Consolas'
 
+# The loaded font, created on the first call to _render_text.
+_FONT = None
+
+# The size, in pixels, of the square cells used to index the drawn leaf
+# rectangles, so a click only has to be tested against the leaves near it.
+LEAF_INDEX_CELL = 32
+
+# The screen and (rect, leaf) pairs last drawn by render_display, so the next
+# call only has to redraw the rectangles that changed.
+_DISPLAYED = None
+# The cell index of the pairs in _DISPLAYED, built on the first click after
+# render_display draws a different set of rectangles.
+_LEAF_INDEX = None
+
 
 def run_visualisation(tree):
     """Display an interactive graphical display of the given tree's treemap.
@@ -47,22 +60,51 @@ def render_display(screen, tree, text):
     Use the constants TREEMAP_HEIGHT and FONT_HEIGHT to divide the
     screen vertically into the treemap and text comments.
 
+    After the first call for a screen, only the rectangles that changed
+    since the previous call, and the text, are redrawn and updated.
+
     @type screen: pygame.Surface
     @type tree: AbstractTree
     @type text: str
         The text to render.
     @rtype: None
     """
-    pygame.draw.rect(screen, pygame.color.THECOLORS['black'],
-                     (0, 0, WIDTH, HEIGHT))
-    tree_map = tree.generate_treemap((0, 0, WIDTH, TREEMAP_HEIGHT))
-    if len(tree_map) == 0:
-        pass
+    global _DISPLAYED, _LEAF_INDEX
+    black = pygame.color.THECOLORS['black']
+    tree_map = tree.generate_leaf_rects((0, 0, WIDTH, TREEMAP_HEIGHT))
+    if _DISPLAYED is None or _DISPLAYED[0] is not screen:
+        # nothing of this tree is on the screen yet, so draw all of it.
+        screen.fill(black)
+        for file_rect in tree_map:
+            pygame.Surface.fill(screen, file_rect[1].colour, file_rect[0])
+        if len(tree_map) > 0:
+            _render_text(screen, text)
+        pygame.display.flip()
+        _LEAF_INDEX = None
     else:
+        displayed = set(_DISPLAYED[1])
+        drawn = set(tree_map)
+        dirty_rects = []
+        # clear the rectangles that are no longer part of the treemap.
+        for file_rect in _DISPLAYED[1]:
+            if file_rect not in drawn:
+                pygame.Surface.fill(screen, black, file_rect[0])
+                dirty_rects.append(file_rect[0])
         for file_rect in tree_map:
-            pygame.Surface.fill(screen, file_rect[1], file_rect[0])
-        _render_text(screen, text)
-    pygame.display.flip()
+            if file_rect not in displayed:
+                pygame.Surface.fill(screen, file_rect[1].colour, file_rect[0])
+                dirty_rects.append(file_rect[0])
+        # the index is only out of date if a rectangle was cleared or drawn,
+        # not when just the text changed.
+        if len(dirty_rects) > 0:
+            _LEAF_INDEX = None
+        text_rect = (0, TREEMAP_HEIGHT, WIDTH, FONT_HEIGHT)
+        pygame.Surface.fill(screen, black, text_rect)
+        dirty_rects.append(text_rect)
+        if len(tree_map) > 0:
+            _render_text(screen, text)
+        pygame.display.update(dirty_rects)
+    _DISPLAYED = (screen, tree_map)
 
 
 def _render_text(screen, text):
@@ -72,9 +114,11 @@ def _render_text(screen, text):
     @type text: str
     @rtype: None
     """
-    # The font we want to use
-    font = pygame.font.SysFont(FONT_FAMILY, FONT_HEIGHT - 8)
-    text_surface = font.render(text, 1, pygame.color.THECOLORS['white'])
+    global _FONT
+    # The font we want to use, loaded from disk only once.
+    if _FONT is None:
+        _FONT = pygame.font.SysFont(FONT_FAMILY, FONT_HEIGHT - 8)
+    text_surface = _FONT.render(text, 1, pygame.color.THECOLORS['white'])
 
     # Where to render the text_surface
     text_pos = (0, HEIGHT - FONT_HEIGHT + 4)
@@ -93,60 +137,94 @@ def event_loop(screen, tree):
     @type tree: AbstractTree
     @rtype: None
     """
-    selected_leaf = ''
-    rect = (0, 0, WIDTH, TREEMAP_HEIGHT)
-    leaf_info = []
+    selected_leaf = None
     while True:
         # Wait for an event
-        event = pygame.event.poll()
+        event = pygame.event.wait()
         if event.type == pygame.QUIT:
             return
         if event.type == pygame.MOUSEBUTTONUP:
             # left click
             if event.button == 1:
-                new_leaf = tree.locate_leaf(event.pos, rect)
-                leaf_info = set_selected_leaf(new_leaf, selected_leaf)
-                selected_leaf = leaf_info[0]
-                # leaf's data size as a text.
-                leaf_data = '  ' + leaf_info[1]
-                render_display(screen, tree,
-                               (selected_leaf + leaf_data).strip())
+                new_leaf = locate_leaf(event.pos)
+                selected_leaf = set_selected_leaf(new_leaf, selected_leaf)
+                render_display(screen, tree, _leaf_text(selected_leaf))
             # right click
             elif event.button == 3:
-                new_leaf = tree.locate_leaf(event.pos, rect)
-                tree.delete_leaf(new_leaf[0])
-                leaf_info = set_selected_leaf(new_leaf, selected_leaf)
-                selected_leaf = leaf_info[0]
-                # leaf's data size as a text.
-                leaf_data = '  ' + leaf_info[1]
-                tree.data_size = tree.update_data_size()
-                render_display(screen, tree,
-                               (selected_leaf + leaf_data).strip())
+                new_leaf = locate_leaf(event.pos)
+                # the leaf's text, taken before the leaf is emptied.
+                text = _leaf_text(set_selected_leaf(new_leaf, selected_leaf))
+                if new_leaf is not None:
+                    tree.delete_leaf(new_leaf)
+                render_display(screen, tree, text)
                 # No longer can the user update the previous
                 # deleated leaf.
-                leaf_info = []
-                selected_leaf = ''
+                selected_leaf = None
         elif event.type == pygame.KEYUP:
             # up key
-            if event.key == pygame.K_UP and selected_leaf is not '':
+            if event.key == pygame.K_UP and selected_leaf is not None:
                 tree.increase_data_size(selected_leaf)
-                leaf_data_size = int(leaf_info[1])
-                leaf_data_size += math.ceil(leaf_data_size * 0.01)
-                leaf_info[1] = str(leaf_data_size)
-                tree.data_size = tree.update_data_size()
                 # displays the new leaf data_size
-                render_display(screen, tree, selected_leaf
-                               + '  ' + str(leaf_data_size))
+                render_display(screen, tree, _leaf_text(selected_leaf))
             # down key
-            elif event.key == pygame.K_DOWN and selected_leaf is not '':
+            elif event.key == pygame.K_DOWN and selected_leaf is not None:
                 tree.decrease_data_size(selected_leaf)
-                leaf_data_size = int(leaf_info[1])
-                leaf_data_size -= math.ceil(leaf_data_size * 0.01)
-                leaf_info[1] = str(leaf_data_size)
-                tree.data_size = tree.update_data_size()
                 # displays the new leaf data_size
-                render_display(screen, tree, selected_leaf
-                               + '  ' + str(leaf_data_size))
+                render_display(screen, tree, _leaf_text(selected_leaf))
+
+
+def _leaf_text(leaf):
+    """Return the text displayed for the given selected leaf: its path from
+    the root of the tree and its data_size, or '' if no leaf is selected.
+
+    @type leaf: AbstractTree | None
+    @rtype: str
+    """
+    if leaf is None:
+        return ''
+    return leaf.get_separator() + '  ' + str(leaf.data_size)
+
+
+def locate_leaf(pos):
+    """Return the leaf drawn at <pos> by the last call to render_display,
+    or None if there is no leaf at <pos>.
+
+    Only the leaves whose rectangles overlap the LEAF_INDEX_CELL sized cell
+    containing <pos> are tested.
+
+    @type pos: (int, int)
+    @rtype: AbstractTree | None
+    """
+    global _LEAF_INDEX
+    if _DISPLAYED is None:
+        return None
+    if _LEAF_INDEX is None:
+        _LEAF_INDEX = _index_leaf_rects(_DISPLAYED[1])
+    cell = (pos[0] // LEAF_INDEX_CELL, pos[1] // LEAF_INDEX_CELL)
+    for (x, y, width, height), leaf in _LEAF_INDEX.get(cell, []):
+        if x <= pos[0] < x + width and y <= pos[1] < y + height:
+            return leaf
+    return None
+
+
+def _index_leaf_rects(leaf_rects):
+    """Return a dictionary mapping each LEAF_INDEX_CELL sized cell of the
+    screen, as (column, row), to the (rect, leaf) pairs overlapping it.
+
+    @type leaf_rects: list[((int, int, int, int), AbstractTree)]
+    @rtype: dict[(int, int), list[((int, int, int, int), AbstractTree)]]
+    """
+    index = {}
+    for leaf_rect in leaf_rects:
+        x, y, width, height = leaf_rect[0]
+        if width <= 0 or height <= 0:
+            continue
+        for column in range(x // LEAF_INDEX_CELL,
+                            (x + width - 1) // LEAF_INDEX_CELL + 1):
+            for row in range(y // LEAF_INDEX_CELL,
+                             (y + height - 1) // LEAF_INDEX_CELL + 1):
+                index.setdefault((column, row), []).append(leaf_rect)
+    return index
 
 
 def run_treemap_file_system(path):
@@ -170,25 +248,20 @@ def run_treemap_population():
     run_visualisation(pop_tree)
 
 
-def set_selected_leaf(leaf_info, selected_leaf):
-    """Compares selected leaf to the first item in leaf_info. If the two
-    are different or if selected_leaf is an empty string, selected_leaf
-    will be set to that item. If the first item in leaf_info and the
-    selected_leaf are the same string, selected_leaf will be set to an
-    empty string.
+def set_selected_leaf(leaf, selected_leaf):
+    """Compares selected_leaf to the given leaf. If the two are different,
+    the given leaf becomes the selected leaf. If they are the same leaf,
+    it is deselected.
 
-    Returns the selected_leaf as either None or a new AbstractTree leaf.
+    Returns the new selected leaf, or None if no leaf is selected.
 
-    @type leaf_info: list[str]
-    @type selected_leaf: str
-    @rtype: str
+    @type leaf: AbstractTree | None
+    @type selected_leaf: AbstractTree | None
+    @rtype: AbstractTree | None
     """
-    if leaf_info[0] == selected_leaf:
-        return['', '']
-    else:
-        selected_leaf = leaf_info[0]
-        selected_leaf_data_size = leaf_info[1]
-    return [selected_leaf, selected_leaf_data_size]
+    if leaf is selected_leaf:
+        return None
+    return leaf
 
 
 if __name__ == '__main__':